@@ -1,60 +1,145 @@
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+import argparse
+import asyncio
+import diskcache
+from selectolax.lexbor import LexborHTMLParser
 import html2text
 from ebooklib import epub
+import hashlib
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
+import threading
 import time
 import os
 import logging
-from urllib.parse import urlparse
+from operator import itemgetter
+from urllib.parse import urljoin, urlparse
 from datetime import datetime
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set up logging; default to WARNING so large batches are not throttled by
+# per-article log writes, and let LOG_LEVEL=INFO/DEBUG opt back in
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING'),
+                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def fetch_page_content(url, max_retries=3, retry_delay=5):
-    """Fetch content from a webpage with retries"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    # brotli roughly halves HTML bytes on the wire vs gzip; aiohttp
+    # auto-decompresses both (brotli via the Brotli package)
+    'Accept-Encoding': 'gzip, br',
+}
+
+# Cap on simultaneous in-flight requests so gather() over many URLs
+# does not overwhelm the origin or the connector
+MAX_IN_FLIGHT = 16
+
+# On-disk cache of fetched pages so repeat runs skip the network entirely
+HTTP_CACHE = diskcache.Cache('.http_cache')
+CACHE_TTL = 86400  # one day, in seconds
+
+# href values that point at articles; scanning the raw HTML with a compiled
+# regex avoids building a DOM just to enumerate links
+HREF_RE = re.compile(r'href=["\'](?P<u>[^"\']*(?:/analyses/|/blog/)[^"\']*)["\']')
+
+# Title sources tried in order of preference; the second element names the
+# attribute holding the value, or None when it lives in the node text
+TITLE_SELECTORS = [
+    ('div.post-header h1.post-title', None),
+    ('meta[property="og:title"]', 'content'),
+    ('title', None),
+    ('h1', None),
+    ('h2', None),
+]
+
+# Patterns used on every article, compiled once
+_INVALID_FN = re.compile(r'[<>:"/\\|?*]')
+_WS = re.compile(r'\s+')
+_URL_DATE = re.compile(r'/(\d{4})/(\d{1,2})/(\d{1,2})/')
+
+# Each strptime format is guarded by a cheap shape check so the common case
+# does not raise and catch a ValueError per format
+_DATE_FMTS = (
+    (re.compile(r'[A-Za-z]+ \d{1,2}, \d{4}$'), '%B %d, %Y'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}$'), '%Y-%m-%d'),
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4}$'), '%d/%m/%Y'),
+)
+
+# HTML2Text instances carry per-call state, so share one per thread rather
+# than constructing a fresh converter for every article
+_H2T_LOCAL = threading.local()
+
+def _get_html2text():
+    converter = getattr(_H2T_LOCAL, 'converter', None)
+    if converter is None:
+        converter = html2text.HTML2Text()
+        converter.ignore_links = False
+        converter.body_width = 0  # skip re-wrapping work
+        _H2T_LOCAL.converter = converter
+    return converter
+
+def make_client_session():
+    """Create an aiohttp session with pooled keep-alive connections"""
+    connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=60)
+    return aiohttp.ClientSession(headers=HEADERS, connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=30))
+
+async def fetch_page_content(session, url, sem, max_retries=3, retry_delay=5):
+    """Fetch a page as raw bytes with retries, revalidating the disk cache via conditional GETs
+
+    Returning undecoded bytes avoids holding a second (str) copy of every
+    page in memory; Lexbor parses bytes directly.
+    """
+    entry = HTTP_CACHE.get(url)
+    if entry is not None and HTTP_CACHE.get(f'fresh:{url}') is not None:
+        return entry['body']
+
+    # Stale (or no-TTL) entry: ask the origin to confirm it is still current
+    headers = {}
+    if entry is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            return response.text
-        except requests.RequestException as e:
-            logger.error(f"Attempt {attempt + 1}/{max_retries} failed for URL {url}: {str(e)}")
+            async with sem:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and entry is not None:
+                        # Origin confirmed our copy is current; just refresh its TTL
+                        HTTP_CACHE.set(f'fresh:{url}', True, expire=CACHE_TTL)
+                        return entry['body']
+                    response.raise_for_status()  # Raise an exception for bad status codes
+                    content = await response.read()
+                    # Keep the body and its validators indefinitely; the 'fresh'
+                    # marker decides when the next run must revalidate
+                    HTTP_CACHE.set(url, {
+                        'body': content,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    })
+                    HTTP_CACHE.set(f'fresh:{url}', True, expire=CACHE_TTL)
+                    return content
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error("Attempt %d/%d failed for URL %s: %s", attempt + 1, max_retries, url, e)
             if attempt < max_retries - 1:
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
             else:
                 raise
 
 def extract_article_urls(main_page_content, base_url="https://jack-vanlightly.com"):
     """Extract article URLs from the main page maintaining their original order"""
-    soup = BeautifulSoup(main_page_content, 'html.parser')
-    links = soup.find_all('a', href=True)
-    article_urls = []  # Use list to maintain order
-    
-    seen_urls = set()  # For deduplication while maintaining order
-    for link in links:
-        href = link['href']
-        # Specifically look for analysis URLs
-        if '/analyses/' in href or '/blog/' in href:
-            full_url = href if href.startswith('http') else f"{base_url.rstrip('/')}/{href.lstrip('/')}"
-            if full_url not in seen_urls:
-                seen_urls.add(full_url)
-                article_urls.append(full_url)
-    
-    return article_urls
+    # dict.fromkeys deduplicates in a single pass while keeping first-seen order
+    urls = (urljoin(base_url, match.group('u'))
+            for match in HREF_RE.finditer(main_page_content))
+    return list(dict.fromkeys(urls))
 
 def sanitize_filename(title):
     """Convert title to a safe filename"""
     # Replace invalid filename characters
-    safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
+    safe_title = _INVALID_FN.sub('_', title)
     # Limit length and remove trailing spaces/dots
     return safe_title[:100].strip('. ')
 
@@ -94,81 +179,72 @@ def create_epub(articles, output_dir="output", title="Downloaded Articles"):
         
         # Write EPUB file
         epub.write_epub(str(epub_path), book)
-        logger.info(f"Created EPUB file: {epub_path}")
+        logger.info("Created EPUB file: %s", epub_path)
         return str(epub_path)
     
     except Exception as e:
-        logger.error(f"Error creating EPUB: {str(e)}")
+        logger.error("Error creating EPUB: %s", e)
         return None
 
-def convert_epub_to_mobi(epub_path):
-    """Convert EPUB to MOBI using Calibre's ebook-convert"""
+def start_mobi_conversion(epub_path):
+    """Start Calibre's ebook-convert in the background, returning (process, mobi_path)"""
     try:
         mobi_path = str(Path(epub_path).with_suffix('.mobi'))
-        subprocess.run(['ebook-convert', epub_path, mobi_path], 
-                     check=True, 
-                     capture_output=True, 
-                     text=True)
-        logger.info(f"Created MOBI file: {mobi_path}")
-        return mobi_path
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error converting to MOBI: {e.stderr}")
-        logger.error("Make sure Calibre is installed (brew install calibre)")
-        return None
+        process = subprocess.Popen(['ebook-convert', epub_path, mobi_path],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   text=True)
+        return process, mobi_path
     except Exception as e:
-        logger.error(f"Unexpected error during MOBI conversion: {str(e)}")
+        logger.error("Unexpected error during MOBI conversion: %s", e)
+        return None
+
+def finish_mobi_conversion(conversion):
+    """Wait for a conversion started by start_mobi_conversion"""
+    if not conversion:
+        return None
+    process, mobi_path = conversion
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        logger.error("Error converting to MOBI: %s", stderr)
+        logger.error("Make sure Calibre is installed (brew install calibre)")
         return None
+    logger.info("Created MOBI file: %s", mobi_path)
+    return mobi_path
 
-def extract_article_content(soup):
+def convert_epub_to_mobi(epub_path):
+    """Convert EPUB to MOBI using Calibre's ebook-convert"""
+    return finish_mobi_conversion(start_mobi_conversion(epub_path))
+
+def extract_article_content(tree):
     """Extract article content with better error handling"""
     try:
         # Try different potential content containers
-        content_div = None
-        for class_name in ['post-content', 'post', 'article', 'entry-content']:
-            content_div = soup.find('div', class_=class_name)
-            if content_div:
-                break
-        
+        content_div = tree.css_first('div.post-content, div.post, div.article, div.entry-content')
+
         if not content_div:
             logger.warning("Could not find content container")
             return None, None
-        
-        # Extract title - improved title extraction with better selectors
+
+        # Extract title - walk the ranked selector list, first hit wins
         title = None
-        
-        # Try to find title in specific blog structure
-        header = soup.find('div', class_='post-header')
-        if header:
-            h1 = header.find('h1', class_='post-title')
-            if h1:
-                title = h1.text.strip()
-        
-        # Try meta title if header title not found
-        if not title:
-            meta_title = soup.find('meta', property='og:title')
-            if meta_title:
-                title = meta_title.get('content', '').strip()
-        
-        # Try document title if meta title not found
-        if not title:
-            doc_title = soup.find('title')
-            if doc_title:
-                title = doc_title.text.strip()
+        for selector, attr in TITLE_SELECTORS:
+            node = tree.css_first(selector)
+            if node is None:
+                continue
+            text = (node.attributes.get(attr) or '') if attr else node.text()
+            text = text.strip()
+            if selector == 'title':
                 # Remove blog name from title if present
-                title = title.split('|')[0].strip()
-        
-        # Try standard heading tags if still no title
-        if not title:
-            for title_tag in ['h1', 'h2']:
-                title_elem = soup.find(title_tag)
-                if title_elem:
-                    title = title_elem.text.strip()
-                    break
-        
+                text = text.split('|')[0].strip()
+            if text:
+                title = text
+                break
+
         # Extract from URL as last resort
         if not title:
             try:
-                url = soup.find('link', rel='canonical')['href']
+                url = tree.css_first('link[rel="canonical"]').attributes['href']
                 path_parts = urlparse(url).path.split('/')
                 # Find the last meaningful part of the URL
                 for part in reversed(path_parts):
@@ -184,186 +260,178 @@ def extract_article_content(soup):
         
         # Clean up content
         # Remove unwanted elements
-        for unwanted in content_div.find_all(['script', 'style', 'iframe']):
+        for unwanted in content_div.css('script, style, iframe'):
             unwanted.decompose()
-        
+
         # Clean up the title
         title = title.replace('\n', ' ').strip()
-        title = re.sub(r'\s+', ' ', title)  # Replace multiple spaces with single space
-        
-        content = str(content_div)
+        title = _WS.sub(' ', title)  # Replace multiple spaces with single space
+
+        content = content_div.html
         return title, content
     
     except Exception as e:
-        logger.error(f"Error extracting article content: {str(e)}")
+        logger.error("Error extracting article content: %s", e)
         return None, None
 
-def extract_article_date(url, soup):
+def extract_article_date(url, tree):
     """Extract the publication date from the article"""
     try:
         # Try to extract date from URL first (most reliable for this blog)
-        url_match = re.search(r'/(\d{4})/(\d{1,2})/(\d{1,2})/', url)
+        url_match = _URL_DATE.search(url)
         if url_match:
             year, month, day = map(int, url_match.groups())
             return datetime(year, month, day)
-        
+
         # Try meta tags
-        meta_date = soup.find('meta', property=['article:published_time', 'og:published_time'])
+        meta_date = tree.css_first('meta[property="article:published_time"], meta[property="og:published_time"]')
         if meta_date:
-            date_str = meta_date.get('content')
+            date_str = meta_date.attributes.get('content')
             return datetime.fromisoformat(date_str.split('T')[0])
-        
+
         # Try looking for date in the post header
-        date_elem = soup.find(class_=['post-date', 'date', 'published'])
+        date_elem = tree.css_first('.post-date, .date, .published')
         if date_elem:
-            date_str = date_elem.text.strip()
-            # Try different date formats
-            for fmt in ['%B %d, %Y', '%Y-%m-%d', '%d/%m/%Y']:
-                try:
-                    return datetime.strptime(date_str, fmt)
-                except ValueError:
-                    continue
+            date_str = date_elem.text().strip()
+            # Try the formats whose shape matches the string
+            for pattern, fmt in _DATE_FMTS:
+                if pattern.fullmatch(date_str):
+                    try:
+                        return datetime.strptime(date_str, fmt)
+                    except ValueError:
+                        continue
         
         # If no date found, use a very old date to put at the end
         return datetime(1900, 1, 1)
     except Exception as e:
-        logger.warning(f"Could not extract date: {str(e)}")
+        logger.warning("Could not extract date: %s", e)
         return datetime(1900, 1, 1)
 
-def save_article_text(title, content, output_dir="output"):
+def parse_article(html, url):
+    """Parse an article page, bundling content and date extraction (runs in the executor)"""
+    tree = LexborHTMLParser(html)
+    title, content = extract_article_content(tree)
+    date = extract_article_date(url, tree)
+    return date, title, content
+
+def save_article_text(title, content, url, output_dir="output"):
     """Save article content as text file for backup"""
     try:
         output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Create a unique filename using the title
-        filename = f"{sanitize_filename(title)}.txt"
+
+        # A short hash of the URL makes the filename unique without
+        # probing the directory for free names
+        suffix = hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
+        filename = f"{sanitize_filename(title)}_{suffix}.txt"
         file_path = output_dir / filename
-        
-        # If file exists, add a number to make it unique
-        counter = 1
-        while file_path.exists():
-            filename = f"{sanitize_filename(title)}_{counter}.txt"
-            file_path = output_dir / filename
-            counter += 1
-        
-        converter = html2text.HTML2Text()
-        converter.ignore_links = False
-        text_content = converter.handle(content)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
+
+        text_content = _get_html2text().handle(content)
+
+        # O_EXCL creates the file atomically (no separate existence check);
+        # the large buffer turns the many small writes into one syscall
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        with os.fdopen(fd, 'w', encoding='utf-8', buffering=1 << 20) as f:
             f.write(f"Title: {title}\n\n")
             f.write(text_content)
-        
-        logger.info(f"Saved text version: {file_path}")
+
+        logger.info("Saved text version: %s", file_path)
+        return str(file_path)
+
+    except FileExistsError:
+        logger.info("Text version already exists: %s", file_path)
         return str(file_path)
-    
     except Exception as e:
-        logger.error(f"Error saving text file: {str(e)}")
+        logger.error("Error saving text file: %s", e)
         return None
 
-def main(main_url, output_dir="output"):
-    """Main function to download and convert articles"""
+async def main(main_url, output_dir="output", title="Jack Vanlightly Articles"):
+    """Main function to download and convert articles; returns True on success"""
     try:
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
-        
-        # Fetch main page content
-        main_page_content = fetch_page_content(main_url)
-        if not main_page_content:
-            logger.error("Failed to fetch main page content")
-            return
-        
-        # Extract article URLs
-        article_urls = extract_article_urls(main_page_content)
-        if not article_urls:
-            logger.error("No article URLs found")
-            return
-        
-        # Sort URLs by date (newest first)
-        sorted_urls = []
-        for url in article_urls:
-            try:
-                content = fetch_page_content(url)
-                if content:
-                    soup = BeautifulSoup(content, 'html.parser')
-                    date = extract_article_date(url, soup)
-                    sorted_urls.append((date if date else datetime.min, url))
-            except Exception as e:
-                logger.error(f"Error processing URL {url}: {str(e)}")
-                continue
-        
-        sorted_urls.sort(reverse=True)  # Sort by date, newest first
-        article_urls = [url for _, url in sorted_urls]  # Extract just the URLs
-        
-        # Process each article
-        articles = []
-        for url in article_urls:
-            try:
-                content = fetch_page_content(url)
-                if content:
-                    soup = BeautifulSoup(content, 'html.parser')
-                    title, article_content = extract_article_content(soup)
+
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            async with make_client_session() as session:
+                # Fetch main page content
+                main_page_content = await fetch_page_content(session, main_url, sem)
+                if not main_page_content:
+                    logger.error("Failed to fetch main page content")
+                    return False
+
+                # Extract article URLs (the regex sweep needs text; only this
+                # one page is ever decoded)
+                article_urls = extract_article_urls(main_page_content.decode('utf-8', 'replace'))
+                if not article_urls:
+                    logger.error("No article URLs found")
+                    return False
+
+                # Fetch and parse each article exactly once; each task fetches
+                # under the semaphore and parses in the executor so fetch and
+                # parse overlap. Date and content come from the same parse.
+                async def article_for(url):
+                    try:
+                        content = await fetch_page_content(session, url, sem)
+                    except Exception as e:
+                        logger.error("Error processing article %s: %s", url, e)
+                        return None
+                    if not content:
+                        return None
+                    date, title, article_content = await loop.run_in_executor(
+                        executor, parse_article, content, url)
                     if title and article_content:
-                        articles.append((title, url, article_content))
-                        # Save article text for backup
-                        save_article_text(title, article_content, output_dir)
-            except Exception as e:
-                logger.error(f"Error processing article {url}: {str(e)}")
-                continue
-        
+                        return (date if date else datetime.min, title, article_content, url)
+                    return None
+
+                results = await asyncio.gather(*(article_for(url) for url in article_urls))
+
+        # Sort by date, newest first
+        parsed = sorted((result for result in results if result),
+                        key=itemgetter(0), reverse=True)
+        articles = [(title, url, article_content)
+                    for _, title, article_content, url in parsed]
+
         if not articles:
             logger.error("No articles were successfully processed")
-            return
-        
+            return False
+
         # Create EPUB file
-        epub_path = create_epub(articles, output_dir, "Jack Vanlightly Articles")
+        epub_path = create_epub(articles, output_dir, title)
         if not epub_path:
             logger.error("Failed to create EPUB file")
-            return
-        
-        # Convert to MOBI
-        mobi_path = convert_epub_to_mobi(epub_path)
+            return False
+
+        # Start the MOBI conversion, then write the text backups while
+        # ebook-convert runs in the background
+        conversion = start_mobi_conversion(epub_path)
+        for article_title, url, article_content in articles:
+            # Save article text for backup
+            save_article_text(article_title, article_content, url, output_dir)
+
+        mobi_path = finish_mobi_conversion(conversion)
         if not mobi_path:
             logger.error("Failed to convert to MOBI")
-            return
-        
+            return False
+
         logger.info("Successfully created EPUB and MOBI files")
-        
+        return True
+
     except Exception as e:
-        logger.error(f"Error in main function: {str(e)}")
+        logger.error("Error in main function: %s", e)
+        return False
 
 if __name__ == "__main__":
-    # You can customize these parameters
-    MAIN_URL = "https://jack-vanlightly.com/analysis-archive"
-    OUTPUT_DIR = "downloaded_articles"
-    
-    try:
-        main_content = fetch_page_content(MAIN_URL)
-        article_urls = extract_article_urls(main_content)
-        
-        articles = []
-        for url in article_urls:
-            try:
-                content = fetch_page_content(url)
-                soup = BeautifulSoup(content, 'html.parser')
-                title = soup.title.string if soup.title else "Untitled"
-                article_content = extract_article_content(soup)
-                articles.append((title, url, article_content))
-            except Exception as e:
-                logger.error(f"Error processing article {url}: {str(e)}")
-        
-        # Create EPUB with fixed filename
-        epub_path = create_epub(articles, output_dir=OUTPUT_DIR, title="jack_vanlightly_articles")
-        
-        if epub_path:
-            # Convert to MOBI with the same base filename
-            convert_epub_to_mobi(epub_path)
-            logger.info("Successfully created both EPUB and MOBI files")
-        else:
-            logger.error("Failed to create EPUB file")
-            exit(1)
-            
-    except Exception as e:
-        logger.error(f"Main process failed: {str(e)}")
+    parser = argparse.ArgumentParser(
+        description="Download articles and build text, EPUB and MOBI archives")
+    parser.add_argument('--url', default="https://jack-vanlightly.com/analysis-archive",
+                        help="archive page to scan for article links")
+    parser.add_argument('--output-dir', default="downloaded_articles",
+                        help="directory for the text, EPUB and MOBI output")
+    parser.add_argument('--title', default="jack_vanlightly_articles",
+                        help="ebook title, also used for the output filenames")
+    args = parser.parse_args()
+
+    if not asyncio.run(main(args.url, args.output_dir, args.title)):
         exit(1)
\ No newline at end of file